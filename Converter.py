@@ -1,18 +1,109 @@
-import copy
+import csv
+import io
+import numpy
 from .FisnarCommands import FisnarCommands
-from .gcodeBuddy.marlin import Command
+from .gcodeBuddy.marlin import Command, marlin_commands
 from .PrinterAttributes import PrintSurface
 from .UltimusV import UltimusV
 
 from UM.Logger import Logger
 
 
+class FisnarCommandTypes:  # enumeration class for fisnar command types (used in the fisnar command arrays)
+    # the commands with x/y/z coordinates are numbered first, so 'command_type <= LINE_END' checks for them
+    DUMMY_POINT = 0
+    LINE_START = 1
+    LINE_PASSING = 2
+    LINE_END = 3
+    OUTPUT = 4
+    LINE_SPEED = 5
+    END_PROGRAM = 6
+    Z_CLEARANCE = 7
+
+    # fisnar command names, indexed by command type
+    NAMES = ("Dummy Point", "Line Start", "Line Passing", "Line End", "Output", "Line Speed", "End Program", "Z Clearance")
+
+
+class FisnarCommandArrays:
+    # class holding a fisnar command list as parallel numpy arrays, with one row per command: the
+    # command type (FisnarCommandTypes), x/y/z coords, output port and state, and line speed. Only
+    # the columns that apply to a row's command type are meaningful. Used during conversion so
+    # operations can be done on every command at once - toList() gives the usual 2d list form
+
+    def __init__(self, capacity):
+        # allocate rows for up to 'capacity' commands
+        self.types = numpy.empty(capacity, dtype=numpy.uint8)
+        self.coords = numpy.zeros((capacity, 3), dtype=numpy.float64)
+        self.outputs = numpy.zeros((capacity, 2), dtype=numpy.int8)
+        self.speeds = numpy.zeros(capacity, dtype=numpy.float64)
+
+    def truncate(self, size):
+        # drop all rows after the first 'size' rows
+        self.types = self.types[:size]
+        self.coords = self.coords[:size]
+        self.outputs = self.outputs[:size]
+        self.speeds = self.speeds[:size]
+
+    def filter(self, keep):
+        # keep only the rows where the given boolean mask is True
+        self.types = self.types[keep]
+        self.coords = self.coords[keep]
+        self.outputs = self.outputs[keep]
+        self.speeds = self.speeds[keep]
+
+    def toList(self):
+        # get the commands as a 2d list of fisnar commands
+        names = FisnarCommandTypes.NAMES
+        coords = self.coords.tolist()
+        fisnar_commands = [None] * len(self.types)
+        for i, (command_type, xyz, output, speed) in enumerate(zip(self.types.tolist(), coords, self.outputs.tolist(), self.speeds.tolist())):
+            if command_type <= FisnarCommandTypes.LINE_END:  # command with x/y/z coordinates
+                fisnar_commands[i] = [names[command_type]] + xyz
+            elif command_type == FisnarCommandTypes.OUTPUT:
+                fisnar_commands[i] = [names[command_type]] + output
+            elif command_type == FisnarCommandTypes.LINE_SPEED:
+                fisnar_commands[i] = [names[command_type], speed]
+            else:
+                fisnar_commands[i] = [names[command_type]]
+        return fisnar_commands
+
+
+class GcodeCommandTypes:  # enumeration class for gcode command types (used in the pre-parsed gcode table)
+    MOVE = 0  # G0 and G1
+    TOOL_CHANGE = 1  # T<t>
+    OTHER = 2
+
+
 class Converter:
     # class that facilitates the translation of commands between gcode and
     # fisnar commands in several different formats
     #
 
-    XYZ_COMMANDS = ("Dummy Point", "Line Start", "Line Passing", "Line End")
+    # gcode command types (GcodeCommandTypes) by gcode command. T<t> commands are checked for separately
+    GCODE_COMMAND_TYPES = {
+        "G0": GcodeCommandTypes.MOVE,
+        "G1": GcodeCommandTypes.MOVE,
+        "G2": GcodeCommandTypes.OTHER,  # arcs - might implement eventually
+        "G3": GcodeCommandTypes.OTHER,
+        "G90": GcodeCommandTypes.OTHER,  # assuming all commands are absolute coords for now
+        "G91": GcodeCommandTypes.OTHER
+    }
+    MARLIN_COMMANDS = frozenset(marlin_commands())  # every valid gcode command word
+    OUTPUT_PORTS = numpy.arange(1, 5, dtype=numpy.int8)  # fisnar output ports 1 to 4
+    INITIAL_LINE_SPEED = 30  # line speed (mm/sec) set at the start of every fisnar program
+    COMMAND_NAMES = {name: name for name in FisnarCommandTypes.NAMES}  # fisnar command names, mapped to this module's own name strings
+
+    # type of the values in each fisnar command, and the index after its last value, by fisnar command name
+    CSV_VALUE_TYPES = {
+        "Output": (int, 3),
+        "Dummy Point": (float, 4),
+        "Line Speed": (float, 2),
+        "Z Clearance": (int, 2),
+        "End Program": (None, 1),
+        "Line Start": (float, 4),
+        "Line End": (float, 4),
+        "Line Passing": (float, 4)
+    }
 
     def __init__(self):
         self.gcode_commands_str = None  # gcode commands as string separated by \n characters
@@ -54,9 +145,10 @@ class Converter:
         return self.continuous_extrusion
 
     def setGcode(self, gcode_str):
-        # sets the gcode string (and gcode list)
+        # sets the gcode string (and gcode list). The lines are streamed from the string rather
+        # than split into a list of every line up front
         self.gcode_commands_str = gcode_str
-        self.gcode_commands_lst = Converter.getStrippedCommands(gcode_str.split("\n"))
+        self.gcode_commands_lst = Converter.getStrippedCommands(Converter.iterLines(gcode_str))
 
     def getFisnarCommands(self):
         # get the fisnar command list from the last set gcode commands and settings.
@@ -72,193 +164,178 @@ class Converter:
         if fisnar_commands is False:  # error - error info will already be set by convert() function
             return False
 
-        # confirming that all coordinates are within the build volume
-        if not self.boundaryCheck(fisnar_commands):
-            self.setInformation("coordinates fell outside user-specified print surface after conversion; if using build plate adhesion, see the 'preview' tab to ensure all material is within the print surface")
-            return False
-
         self.last_converted_fisnar_commands = fisnar_commands
         return fisnar_commands
 
     def convertCommands(self):
         # convert gcode to fisnar command 2d list. Assumes the extruder outputs given are valid.
-        # returns False if there aren't enough gcode commands to deduce any Fisnar commands.
+        # returns False if there aren't enough gcode commands to deduce any Fisnar commands, or
+        # if any of the converted coordinates fall outside the print surface.
         # Works for both i/o card and non i/o card commands
 
         # useful information for the conversion process
-        first_relevant_command_index = Converter.getFirstPositionalCommandIndex(self.gcode_commands_lst)
-        last_relevant_command_index = Converter.getLastExtrudingCommandIndex(self.gcode_commands_lst)
+        gcode_table = Converter.tabulateGcode(self.gcode_commands_lst)  # pre-parsed, so later passes only deal with plain values
+        _, first_relevant_command_index, last_relevant_command_index, curr_extruder = Converter.scanGcode(gcode_table)
 
         # in case there isn't enough commands (this should never happen in slicer output)
         if first_relevant_command_index is None or last_relevant_command_index is None:
             self.setInformation("not enough gcode commands to deduce Fisnar commands")
             return False
 
-        # default fisnar initial commands
-        fisnar_commands = [["Line Speed", 30], ["SET ME AFTER CONVERTING COORD SYSTEM"]]
-
-        # finding first extruder used in gcode
-        curr_extruder = 0
-        for command in self.gcode_commands_lst:
-            if command.get_command()[0] == "T":
-                curr_extruder = int(command.get_command()[1])
-                break
-
-        curr_pos = [0, 0, 0]
-        curr_speed = 30.0
-        for i in range(len(self.gcode_commands_lst)):
-            command = self.gcode_commands_lst[i]
-
-            # line speed change and converting from mm/min to mm/sec
-            if command.has_param("F") and (command.get_param("F") / 60) != curr_speed:
-                curr_speed = command.get_param("F") / 60
-                fisnar_commands.append(["Line Speed", curr_speed])
-
-            if first_relevant_command_index <= i <= last_relevant_command_index:  # command needs to be converted
-                if command.get_command() in ("G0", "G1"):
-                    new_commands = Converter.g0g1WithIO(command, curr_extruder + 1, curr_pos)
-                    for command in new_commands:
-                        fisnar_commands.append(command)
-                elif command.get_command() in ("G2", "G3"):
-                    pass  # might implement eventually. probably not, these are _rarely_ used.
-                elif command.get_command() == "G90":
-                    pass  # assuming all commands are absolute coords for now.
-                elif command.get_command() == "G91":
-                    pass  # assuming all commands are absolute coords for now.
-                elif command.get_command()[0] == "T":
-                    curr_extruder = int(command.get_command()[1])
+        # the feed rate is modal, so the line speed only needs to be set where it actually changes
+        line_speeds = Converter.getLineSpeedChanges(gcode_table[6], Converter.INITIAL_LINE_SPEED)
 
-        # turning off necessary outputs
-        gcode_outputs = Converter.getOutputsInFisnarCommands(fisnar_commands)
-        Logger.log("d", "gcode outputs: " + str(gcode_outputs))
-        for i in range(4):
-            if gcode_outputs[i]:
-                fisnar_commands.append(["Output", i + 1, 0])
-        fisnar_commands.append(["End Program"])
+        # the fisnar commands are built up as parallel arrays with one row per command: the command
+        # type, x/y/z coords, output port/state, and line speed. These are only assembled into the 2d
+        # fisnar command list once all array operations are done. The arrays are allocated once, big
+        # enough for the most commands the conversion can produce: 2 initial commands, a line speed
+        # for every line speed change, an output and dummy point for every converted command, and 5
+        # final commands. The home dummy point is set after converting the coordinate system
+        capacity = 7 + len(line_speeds) - line_speeds.count(None) + 2 * (last_relevant_command_index - first_relevant_command_index + 1)
+        fisnar_arrays = FisnarCommandArrays(capacity)
+        types, outputs = fisnar_arrays.types, fisnar_arrays.outputs
+
+        n = Converter.fillFisnarArrays(fisnar_arrays, gcode_table, line_speeds, first_relevant_command_index, last_relevant_command_index, curr_extruder)
 
-        # inverting and shifting coordinate system from gcode to fisnar, then putting home travel command
-        Converter.invertCoords(fisnar_commands, self.print_surface.getZMax())
+        # turning off necessary outputs
+        gcode_outputs = numpy.isin(Converter.OUTPUT_PORTS, outputs[:n, 0][types[:n] == FisnarCommandTypes.OUTPUT])
+        Logger.log("d", "gcode outputs: " + str(gcode_outputs.tolist()))
+        off_ports = Converter.OUTPUT_PORTS[gcode_outputs]
+        types[n:n + len(off_ports)] = FisnarCommandTypes.OUTPUT
+        outputs[n:n + len(off_ports), 0] = off_ports
+        outputs[n:n + len(off_ports), 1] = 0
+        n += len(off_ports)
+        types[n] = FisnarCommandTypes.END_PROGRAM
+        n += 1
+        fisnar_arrays.truncate(n)
+
+        # inverting and shifting coordinate system from gcode to fisnar
+        x_min, _, y_min, _, z_max = self.print_surface.getBounds()
+        Converter.invertCoords(fisnar_arrays.coords, z_max)
 
         # put home coordinates into home dummy point
-        fisnar_commands[1] = ["Dummy Point", self.print_surface.getXMin(), self.print_surface.getYMin(), self.print_surface.getZMax()]
+        fisnar_arrays.coords[1] = (x_min, y_min, z_max)
+
+        # confirming that all coordinates are within the build volume
+        if not self.boundaryCheck(fisnar_arrays):
+            self.setInformation("coordinates fell outside user-specified print surface after conversion; if using build plate adhesion, see the 'preview' tab to ensure all material is within the print surface")
+            return False
 
         # removing redundant output and line speed commands
-        Converter.optimizeFisnarOutputCommands(fisnar_commands)
-        Converter.optimizeLineSpeedCommands(fisnar_commands)  # ensures no consectuive line speed commands
+        fisnar_arrays.filter(Converter.optimizeFisnarArrays(fisnar_arrays))
 
         # Logger.log("d", f"Converter: {self.continuous_extrusion}")
         if self.continuous_extrusion:
-            num_outputs = Converter.getOutputsInFisnarCommands(fisnar_commands).count(True)
+            num_outputs = numpy.count_nonzero(gcode_outputs)  # every output used was also turned off above
             # Logger.log("d", f"converter num_outputs: {num_outputs}")
             if num_outputs == 1:  # only one extruder. keep printing continuously
-                first_on_command_ind = None  # first extruding command
-                last_off_command_ind = None  # last command that turns off extrusion (first output off after the last output on)
-
-                for i in range(len(fisnar_commands)):
-                    if fisnar_commands[i][0] == "Output" and fisnar_commands[i][2] == 1:  # output on
-                        if first_on_command_ind is None:  # first extruding command
-                            first_on_command_ind = i
-                        
-                        j = i + 1
-                        next_off_found = False
-                        while j < len(fisnar_commands) and not next_off_found:  # getting next output off after output on
-                            if fisnar_commands[j][0] == "Output" and fisnar_commands[j][2] == 0:
-                                last_off_command_ind = j
-                                next_off_found = True
-                            j += 1
-            
-                # removing all output off and on commands in between the first on and last off commands
-                i = first_on_command_ind + 1  # starting at command after first on command
-                while i < last_off_command_ind:  # ending before last off command
-                    if fisnar_commands[i][0] == "Output":
-                        del fisnar_commands[i]
-                        last_off_command_ind -= 1  # bumping back one index
-                    else:  # not output
-                        i += 1 
+                fisnar_arrays.filter(Converter.getContinuousExtrusionMask(fisnar_arrays))
             else:  # more than one output
                 pass  # TODO: implement this                  
 
+        fisnar_commands = fisnar_arrays.toList()
+        fisnar_commands[0][1] = Converter.INITIAL_LINE_SPEED  # keep the initial line speed as given, not as a float from the speeds array
         return fisnar_commands
 
-    def boundaryCheck(self, fisnar_commands):
-        # check that all coordinates are within the user specified area. If ANY
-        # coordinates fall outside the volume, False will be returned - if all
-        # coordinates fall within the volume, True will be returned
-        for command in fisnar_commands:
-            if command[0] in Converter.XYZ_COMMANDS:
-                if not (self.print_surface.getXMin() <= command[1] <= self.print_surface.getXMax()):
-                    Logger.log("e", f"command found outside user-defined build volume: {str(command)}")
-                    return False
-                if not (self.print_surface.getYMin() <= command[2] <= self.print_surface.getYMax()):
-                    Logger.log("e", f"command found outside user-defined build volume: {str(command)}")
-                    return False
-                if not (0 <= command[3] <= self.print_surface.getZMax()):
-                    Logger.log("e", f"command found outside user-defined build volume: {str(command)}")
-                    return False
-        return True  # functioned hasn't returned False, so all good
-
     @staticmethod
-    def optimizeLineSpeedCommands(fisnar_commands):
-        i = len(fisnar_commands) - 1
-        while i >= 0:
-            if fisnar_commands[i][0] == "Line Speed":
-                i -= 1
-                while fisnar_commands[i][0] == "Line Speed":
-                    fisnar_commands.pop(i)
-                    i -= 1
-            else:
-                i -= 1
-
-    @staticmethod
-    def g0g1NoIO(command, next_command, curr_pos):
-        # take a command, the command after it, and the position before the
-        # current command
-        command_type = None
-        if command.has_param("E") and command.get_param("E") > 0:
-            if next_command.has_param("E") and next_command.get_param("E") > 0:  # E -> E
-                command_type = "Line Passing"
-            else:  # E -> no E
-                command_type = "Line End"
-        else:
-            if next_command.has_param("E") and next_command.get_param("E") > 0:  # no E -> E
-                command_type = "Line Start"
-            else:  # no E -> no E
-                command_type = "Dummy Point"
-
-        # determining command positions (and updating current position)
-        if command.has_param("X"):
-            curr_pos[0] = command.get_param("X")
-        if command.has_param("Y"):
-            curr_pos[1] = command.get_param("Y")
-        if command.has_param("Z"):
-            curr_pos[2] = command.get_param("Z")
-
-        # returning command
-        return [command_type, curr_pos[0], curr_pos[1], curr_pos[2]]
+    def fillFisnarArrays(fisnar_arrays, gcode_table, line_speeds, first_index, last_index, curr_extruder):
+        # write the fisnar commands for the given gcode table (as returned by tabulateGcode) into the
+        # given FisnarCommandArrays, starting at the first row. line_speeds is the list returned by
+        # getLineSpeedChanges. Only the gcode commands from first_index to last_index (inclusive) are
+        # converted, but line speed changes are written for all commands. curr_extruder is the
+        # extruder in use at the first command. Returns the number of rows written
+        types, coords, outputs, speeds = fisnar_arrays.types, fisnar_arrays.coords, fisnar_arrays.outputs, fisnar_arrays.speeds
+        gcode_types, gcode_tools, gcode_xs, gcode_ys, gcode_zs, gcode_es, _ = gcode_table
 
-    @staticmethod
-    def g0g1WithIO(command, curr_output, curr_pos):
-        # turn a g0 or g1 command into a list of the corresponding fisnar commands
-        # update the given curr_pos list
-        ret_commands = []
+        # default fisnar initial commands
+        types[0], speeds[0] = FisnarCommandTypes.LINE_SPEED, Converter.INITIAL_LINE_SPEED
+        types[1] = FisnarCommandTypes.DUMMY_POINT
+        n = 2  # number of fisnar commands
+
+        curr_x, curr_y, curr_z = 0, 0, 0
+        for i, gcode_type in enumerate(gcode_types):
+            line_speed = line_speeds[i]
+            if line_speed is not None:
+                types[n], speeds[n] = FisnarCommandTypes.LINE_SPEED, line_speed
+                n += 1
+
+            # converting the command. G2/G3 (arcs) might be implemented eventually, but probably not - these
+            # are _rarely_ used. G90/G91 are ignored: assuming all commands are absolute coords for now.
+            if first_index <= i <= last_index:  # command needs to be converted
+                if gcode_type == GcodeCommandTypes.MOVE:  # output command (on if extruding, otherwise off) then dummy point
+                    e = gcode_es[i]
+                    if e is not None and e > 0:
+                        types[n], outputs[n] = FisnarCommandTypes.OUTPUT, (curr_extruder + 1, 1)
+                    else:
+                        types[n], outputs[n] = FisnarCommandTypes.OUTPUT, (curr_extruder + 1, 0)
 
-        if command.has_param("E") and command.get_param("E") > 0:  # turn output on
-            ret_commands.append(["Output", curr_output, 1])
-        else:  # turn output off
-            ret_commands.append(["Output", curr_output, 0])
+                    if gcode_xs[i] is not None:
+                        curr_x = gcode_xs[i]
+                    if gcode_ys[i] is not None:
+                        curr_y = gcode_ys[i]
+                    if gcode_zs[i] is not None:
+                        curr_z = gcode_zs[i]
+                    types[n + 1], coords[n + 1] = FisnarCommandTypes.DUMMY_POINT, (curr_x, curr_y, curr_z)
+                    n += 2
+                elif gcode_type == GcodeCommandTypes.TOOL_CHANGE:
+                    curr_extruder = gcode_tools[i]
 
-        x, y, z = curr_pos[0], curr_pos[1], curr_pos[2]
-        if command.has_param("X"):
-            x = command.get_param("X")
-        if command.has_param("Y"):
-            y = command.get_param("Y")
-        if command.has_param("Z"):
-            z = command.get_param("Z")
+        return n
 
-        curr_pos[0], curr_pos[1], curr_pos[2] = x, y, z
-        ret_commands.append(["Dummy Point", x, y, z])
+    @staticmethod
+    def getLineSpeedChanges(gcode_fs, initial_speed):
+        # get a list with one entry per gcode command: the new line speed (converted from mm/min to
+        # mm/sec) for commands that change it, and None for every other command. gcode_fs is the f
+        # param list from tabulateGcode, and initial_speed is the line speed before the first command
+        line_speeds = [None] * len(gcode_fs)
+        curr_speed = initial_speed
+        for i, f in enumerate(gcode_fs):
+            if f is not None and (f / 60) != curr_speed:
+                curr_speed = f / 60
+                line_speeds[i] = curr_speed
+        return line_speeds
+
+    def boundaryCheck(self, fisnar_arrays):
+        # check that all coordinates in the given FisnarCommandArrays are within the user specified
+        # area. If ANY coordinates fall outside the volume, False will be returned - if all
+        # coordinates fall within the volume, True will be returned
+        x_min, x_max, y_min, y_max, z_max = self.print_surface.getBounds()
+        types, coords = fisnar_arrays.types, fisnar_arrays.coords
+        x, y, z = coords[:, 0], coords[:, 1], coords[:, 2]
+        out_of_bounds = (x < x_min) | (x > x_max) | (y < y_min) | (y > y_max) | (z < 0) | (z > z_max)
+        out_of_bounds &= types <= FisnarCommandTypes.LINE_END  # only commands with x/y/z coordinates
+        if out_of_bounds.any():
+            bad_ind = numpy.argmax(out_of_bounds)  # first out of bounds command
+            bad_command = [FisnarCommandTypes.NAMES[types[bad_ind]]] + coords[bad_ind].tolist()
+            Logger.log("e", f"command found outside user-defined build volume: {str(bad_command)}")
+            return False
+        return True
 
-        return ret_commands
+    @staticmethod
+    def tabulateGcode(gcode_commands):
+        # pre-parse a list of gcode Command objects into a table of parallel lists with one entry
+        # per command, returned as a tuple: (command types (GcodeCommandTypes), tool numbers,
+        # x params, y params, z params, e params, f params). Tool numbers are None for anything
+        # other than T commands, and params are None if the command doesn't have that parameter
+        # the lists are allocated at full size up front, so only the entries that aren't the default need setting
+        num_commands = len(gcode_commands)
+        types = [GcodeCommandTypes.OTHER] * num_commands
+        tools, xs, ys, zs, es, fs = ([None] * num_commands for _ in range(6))
+        param_lists = {"X": xs, "Y": ys, "Z": zs, "E": es, "F": fs}
+        command_types = Converter.GCODE_COMMAND_TYPES
+        for i, command in enumerate(gcode_commands):
+            command_str = command.command
+            command_type = command_types.get(command_str)
+            if command_type is not None:
+                types[i] = command_type
+            elif command_str[0] == "T":  # not in the lookup table - T<t> or a command that doesn't matter
+                types[i] = GcodeCommandTypes.TOOL_CHANGE
+                tools[i] = int(command_str[1])
+            for param, value in command.params.items():
+                param_list = param_lists.get(param)
+                if param_list is not None:
+                    param_list[i] = value
+        return types, tools, xs, ys, zs, es, fs
 
     @staticmethod
     def getOutputsInFisnarCommands(commands):
@@ -270,88 +347,123 @@ class Converter:
                 outputs[int(command[1]) - 1] = True
         return outputs
 
+    @staticmethod
+    def iterLines(string):
+        # yield the lines of a string (without line endings) one at a time. Each line is sliced from
+        # the given string as it's needed, so no copy of the whole string or list of lines is made
+        start = 0
+        end = string.find("\n")
+        while end != -1:
+            yield string[start:end]
+            start = end + 1
+            end = string.find("\n", start)
+        yield string[start:]
+
     @staticmethod
     def getStrippedCommands(gcode_lines):
-        # convert a list of gcode lines (in string form) to a list of gcode Command objects
+        # convert a list (or any iterable) of gcode lines (in string form) to a list of gcode Command objects
         # commands are subsequently stripped of comments and empty lines. Only commands are interpreted
         ret_command_list = []  # list to hold Command objects
+        append, from_params = ret_command_list.append, Command.from_params  # looked up once
+        valid_commands, no_parameter_commands = Converter.MARLIN_COMMANDS, Command.NO_PARAMETER_COMMANDS
         for line in gcode_lines:
-            line = line.strip()  # removing whitespace from both ends of string
-            if len(line) > 0 and line[0] != ";":  # only considering non comment and non empty lines
-                if ";" in line:
-                    line = line[:line.find(";")]  # removing comments
-                line = line.strip()  # removing whitespace from both ends of string
-                ret_command_list.append(Command(line))
+            line = line.partition(";")[0].strip()  # removing comments and whitespace from both ends of string
+            if line:  # only considering non comment and non empty lines
+                command_str, *param_strs = line.split()
+                params = {}
+                if command_str in valid_commands and command_str not in no_parameter_commands:
+                    for param_str in param_strs:  # plain '<letter><number>' parameters, read the same way Command does
+                        if not param_str[0].isalpha():
+                            break
+                        try:
+                            params[param_str[0].upper()] = float(param_str[1:])
+                        except ValueError:
+                            break
+                    else:
+                        append(from_params(command_str, params))
+                        continue
+                append(Command(line))  # anything else is left to Command, which raises for invalid lines
         return ret_command_list
 
     @staticmethod
-    def getFirstExtrudingCommandIndex(gcode_commands):
-        # get the index of the first g0/g1 command that extrudes.
-        # this command must be g0/g1, have an x or y or z parameter, and have a non-zero e parameter.
-        for i in range(len(gcode_commands)):
-            command = gcode_commands[i]
-            if command.get_command() in ("G0", "G1"):
-                if command.has_param("X") or command.has_param("Y") or command.has_param("Z"):
-                    if command.has_param("E") and (command.get_param("E") > 0):
-                        return i
-        return None  # no extruding commands. Don't know how a gcode file wouldn't have an extruding command but just in case
+    def scanGcode(gcode_table):
+        # get the information needed before converting a gcode table (as returned by tabulateGcode), found
+        # in a single pass over the table. Returns a tuple: (first extruding command index, first positional
+        # command index, last extruding command index, first extruder used). See the functions below for
+        # what each index means - they are None if not found. The first extruder is 0 if there are no T commands
+        types, tools, xs, ys, zs, es, _ = gcode_table
+        first_extruding_index = None
+        first_positional_index = None
+        last_extruding_index = None
+        last_positional_index = None  # last positional command found so far (before the first extruding command)
+        first_extruder = None
+        for i, command_type in enumerate(types):
+            if command_type == GcodeCommandTypes.MOVE:
+                e = es[i]
+                if e is not None and e > 0:  # extruding
+                    if xs[i] is not None or ys[i] is not None or zs[i] is not None:
+                        if first_extruding_index is None:
+                            first_extruding_index = i
+                            first_positional_index = last_positional_index
+                        last_extruding_index = i
+                elif first_extruding_index is None and xs[i] is not None and ys[i] is not None and zs[i] is not None:
+                    last_positional_index = i
+            elif first_extruder is None and command_type == GcodeCommandTypes.TOOL_CHANGE:
+                first_extruder = tools[i]
+
+        if first_extruder is None:
+            first_extruder = 0
+        return first_extruding_index, first_positional_index, last_extruding_index, first_extruder
 
     @staticmethod
-    def getFirstPositionalCommandIndex(gcode_commands):
-        # get the index of the command that is the start of the first extruding movement.
-        # this is the last command before the first extruding movement command that doesn't extrude
-        # this command must have no e parameter (or zero e parameter), and have an x and y and z parameter
-        first_extruding_index = Converter.getFirstExtrudingCommandIndex(gcode_commands)
-        if first_extruding_index is None:
-            return None  # shouldn't ever happen in a reasonable gcode file
-
-        for i in range(first_extruding_index, -1, -1):
-            command = gcode_commands[i]
-            if command.get_command() in ("G0", "G1"):
-                if command.has_param("X") and command.has_param("Y") and command.has_param("Z"):
-                    if not (command.has_param("E") and command.get_param("E") > 0):
-                        return i
-        return None  # this could be for a variety of reasons, some of which aren't that unlikely. This way of doing things is kind of ghetto. Ultimately, a more sophisticated solution should be enacted.
+    def optimizeFisnarOutputCommands(fisnar_arrays):
+        # get a boolean mask over the given FisnarCommandArrays that is False for every redundant
+        # output command (an output command that sets its output to the state it is already in),
+        # and True for all other commands
+        types, outputs = fisnar_arrays.types, fisnar_arrays.outputs
+        keep = numpy.ones(len(types), dtype=bool)
+        for output in range(1, 5):  # for each output (integer from 1 to 4)
+            output_inds = numpy.flatnonzero((types == FisnarCommandTypes.OUTPUT) & (outputs[:, 0] == output))
+            output_states = outputs[output_inds, 1]
+            keep[output_inds[1:]] = output_states[1:] != output_states[:-1]
+        return keep
 
     @staticmethod
-    def getLastExtrudingCommandIndex(gcode_commands):
-        # get the last command that extrudes material - the last command that needs to be converted.
-        # this command must have an x and/or y and/or z parameter, and have a nonzero e parameter
-        for i in range(len(gcode_commands) - 1, -1, -1):
-            command = gcode_commands[i]
-            if command.get_command() in ("G0", "G1"):
-                if command.has_param("X") or command.has_param("Y") or command.has_param("Z"):
-                    if command.has_param("E") and command.get_param("E") > 0:
-                        return i
-        return None  # this should never happen in any reasonable gcode file.
+    def optimizeFisnarArrays(fisnar_arrays):
+        # get a boolean mask over the given FisnarCommandArrays that is False for every redundant
+        # command, and True for all other commands. Redundant commands are output commands that set
+        # their output to the state it is already in (see optimizeFisnarOutputCommands), and line
+        # speed commands directly followed by another line speed command once those are removed
+        keep = Converter.optimizeFisnarOutputCommands(fisnar_arrays)
+        kept_inds = numpy.flatnonzero(keep)
+        line_speeds = fisnar_arrays.types[kept_inds] == FisnarCommandTypes.LINE_SPEED
+        keep[kept_inds[:-1][line_speeds[:-1] & line_speeds[1:]]] = False
+        return keep
 
     @staticmethod
-    def optimizeFisnarOutputCommands(fisnar_commands):
-        # remove any redundant output commands from fisnar command list
-        for output in range(1, 5):  # for each output (integer from 1 to 4)
-            output_state = None
-            i = 0
-            while i < len(fisnar_commands):
-                if fisnar_commands[i][0] == "Output" and fisnar_commands[i][1] == output:  # is an output 1 command
-                    if output_state is None:  # is the first output 1 command
-                        output_state = fisnar_commands[i][2]
-                        i += 1
-                    elif fisnar_commands[i][2] == output_state:  # command is redundant
-                        fisnar_commands.pop(i)
-                    else:
-                        output_state = fisnar_commands[i][2]
-                        i += 1
-                else:
-                    i += 1
+    def getContinuousExtrusionMask(fisnar_arrays):
+        # get a boolean mask over the given FisnarCommandArrays that is False for every output command
+        # between the first output on and the last output off (the first output off after the last
+        # output on), and True for all other commands - so extrusion is never turned off in between
+        types, outputs = fisnar_arrays.types, fisnar_arrays.outputs
+        keep = numpy.ones(len(types), dtype=bool)
+        is_output = types == FisnarCommandTypes.OUTPUT
+        on_inds = numpy.flatnonzero(is_output & (outputs[:, 1] == 1))
+        if len(on_inds) == 0:  # nothing extrudes
+            return keep
+        off_inds = numpy.flatnonzero(is_output & (outputs[:, 1] == 0))
+        off_inds = off_inds[off_inds > on_inds[-1]]
+        if len(off_inds) == 0:  # extrusion is never turned off at the end
+            return keep
+        first_on_ind, last_off_ind = on_inds[0], off_inds[0]
+        keep[first_on_ind + 1:last_off_ind] = ~is_output[first_on_ind + 1:last_off_ind]
+        return keep
 
     @staticmethod
-    def invertCoords(commands, z_dim):
-        # invert all coordinate directions for dummy points (modifies the given list)
-        for i in range(len(commands)):
-            if commands[i][0] in Converter.XYZ_COMMANDS:
-                commands[i][1] = 200 - commands[i][1]
-                commands[i][2] = 200 - commands[i][2]
-                commands[i][3] = z_dim - commands[i][3]
+    def invertCoords(coords, z_dim):
+        # invert all coordinate directions of an (N, 3) coordinate array (modifies the given array)
+        coords[:, 0:2] = 200 - coords[:, 0:2]
+        coords[:, 2] = z_dim - coords[:, 2]
 
     @staticmethod
     def numNestedElements(nested_list):
@@ -372,50 +484,33 @@ class Converter:
         # of common extrusion state grouped together and all output commands
         # removed
         ret_commands = []
-        temp_commands = []
+        temp_commands = []  # dummy points in the current sequence
+        output_states = [0, 0, 0, 0]
         for command in fisnar_commands:
             if command[0] == "Dummy Point":
-                temp_commands.append(copy.deepcopy(command))
+                temp_commands.append(command[:])  # flat list of scalars, so a shallow copy is enough
             elif command[0] in ("Line Speed", "Output", "End Program"):
-                if temp_commands != []:
+                if temp_commands != []:  # ending the current sequence, with the output states it was run with
+                    temp_commands.append(output_states[:])
                     ret_commands.append(temp_commands)
                     temp_commands = []
-                ret_commands.append(command)
+                if command[0] == "Output":
+                    output_states[command[1] - 1] = command[2]
+                else:
+                    ret_commands.append(command)
 
         if temp_commands != []:  # cleaning up if any dummy points left over
+            temp_commands.append(output_states[:])
             ret_commands.append(temp_commands)
-            temp_commands = []
-
-        output_states = [0, 0, 0, 0]
-        for i in range(len(ret_commands)):
-            if isinstance(ret_commands[i][0], list):  # is a dummy point sublist
-                ret_commands[i].append([output_states[0], output_states[1], output_states[2], output_states[3]])
-            elif ret_commands[i][0] == "Output":  # isn't a sublist, so check if is an output
-                output_states[ret_commands[i][1] - 1] = ret_commands[i][2]
-
-        # deleting output commands
-        i = 0
-        while i < len(ret_commands):
-            if ret_commands[i][0] == "Output":
-                ret_commands.pop(i)
-            else:
-                i += 1
 
         return ret_commands
 
     @staticmethod
     def fisnarCommandsToCSVString(fisnar_commands):
         # turn a 2d list of fisnar commands into a csv string
-        ret_string = ""
-        for i in range(len(fisnar_commands)):
-            for j in range(len(fisnar_commands[i])):
-                ret_string += str(fisnar_commands[i][j])
-                if j == len(fisnar_commands[i]) - 1:
-                    ret_string += "\n"
-                else:
-                    ret_string += ","
-
-        return ret_string
+        csv_buffer = io.StringIO()
+        csv.writer(csv_buffer, lineterminator="\n").writerows(fisnar_commands)
+        return csv_buffer.getvalue()
 
     @staticmethod
     def fisnarCommandsToBytes(fisnar_commands, continuous_extrusion):
@@ -430,85 +525,75 @@ class Converter:
         # that don't hold for continuous printing
 
         ret_bytes = []
+        append = ret_bytes.append  # looked up once, rather than for every command
+        OU, SP, VA = FisnarCommands.OU, FisnarCommands.SP, FisnarCommands.VA
+        id_bytes = FisnarCommands.ID()  # the same for every command, so only made once
+        num_commands = len(fisnar_commands)
         i = 0
 
         if continuous_extrusion:  # might lead to shittier prints (ID() leads to delay in movement - similar issue that octoprint faces - consequence of asynchronous printing)
-            while i < len(fisnar_commands):
-                if fisnar_commands[i][0] == "Output":
-                    ret_bytes.append(FisnarCommands.OU(fisnar_commands[i][1], fisnar_commands[i][2]))
-                elif fisnar_commands[i][0] == "Line Speed":
-                    ret_bytes.append(FisnarCommands.SP(fisnar_commands[i][1]))
-                elif fisnar_commands[i][0] == "Dummy Point":
-                    ret_bytes.append(FisnarCommands.VA(fisnar_commands[i][1], fisnar_commands[i][2], fisnar_commands[i][3]))
-                    ret_bytes.append(FisnarCommands.ID())
-                i += 1
+            for command in fisnar_commands:
+                if command[0] == "Output":
+                    append(OU(command[1], command[2]))
+                elif command[0] == "Line Speed":
+                    append(SP(command[1]))
+                elif command[0] == "Dummy Point":
+                    append(VA(command[1], command[2], command[3]))
+                    append(id_bytes)
             return ret_bytes
         else:
-            while i < len(fisnar_commands):
-                if fisnar_commands[i][0] == "Output" and fisnar_commands[i][2] == 1:
-                    output = fisnar_commands[i][1]
+            while i < num_commands:
+                command = fisnar_commands[i]
+                if command[0] == "Output" and command[2] == 1:
+                    output = command[1]
+                    output_on, output_off = OU(output, 1), OU(output, 0)
                     i += 1
-                    consecutive_dummies = 0
-                    while i < len(fisnar_commands) and fisnar_commands[i][0] == "Dummy Point":
-                        if consecutive_dummies >= 99:
-                            ret_bytes.append(FisnarCommands.OU(output, 1))  # output on
-                            ret_bytes.append(FisnarCommands.ID())
-                            ret_bytes.append(FisnarCommands.OU(output, 0))  # output off
-                            consecutive_dummies = 0
-
-                        ret_bytes.append(FisnarCommands.VA(fisnar_commands[i][1], fisnar_commands[i][2], fisnar_commands[i][3]))
-                        i += 1
-                        consecutive_dummies += 1
+                    run_end = i  # end of the run of dummy points after the output on
+                    while run_end < num_commands and fisnar_commands[run_end][0] == "Dummy Point":
+                        run_end += 1
+                    run_bytes = FisnarCommands.VAList(dummy[1:4] for dummy in fisnar_commands[i:run_end])
+                    for run_start in range(0, len(run_bytes), 99):  # extruding after every 99 consecutive dummy points
+                        if run_start > 0:
+                            append(output_on)
+                            append(id_bytes)
+                            append(output_off)
+                        ret_bytes.extend(run_bytes[run_start:run_start + 99])
+                    i = run_end
 
                     line_speed = fisnar_commands[i][1]
                     i += 2  # skip the output command that comes afterward
 
-                    ret_bytes.append(FisnarCommands.OU(output, 1))  # output on
-                    ret_bytes.append(FisnarCommands.ID())
-                    ret_bytes.append(FisnarCommands.OU(output, 0))  # output off
-                    ret_bytes.append(FisnarCommands.SP(line_speed))
+                    append(output_on)
+                    append(id_bytes)
+                    append(output_off)
+                    append(SP(line_speed))
                 else:
-                    if fisnar_commands[i][0] == "Dummy Point":
-                        ret_bytes.append(FisnarCommands.VA(fisnar_commands[i][1], fisnar_commands[i][2], fisnar_commands[i][3]))
-                        ret_bytes.append(FisnarCommands.ID())
-                        i += 1
-                    elif fisnar_commands[i][0] == "Line Speed":
-                        ret_bytes.append(FisnarCommands.SP(fisnar_commands[i][1]))
-                        i += 1
+                    if command[0] == "Dummy Point":
+                        append(VA(command[1], command[2], command[3]))
+                        append(id_bytes)
+                    elif command[0] == "Line Speed":
+                        append(SP(command[1]))
                     else:
-                        Logger.log("w", "unaccounted for command in fisnar_commands: " + str(fisnar_commands[i]))
-                        i += 1
+                        Logger.log("w", "unaccounted for command in fisnar_commands: " + str(command))
+                    i += 1
             return ret_bytes
 
     @staticmethod
     def readFisnarCommandsFromCSV(csv_string):
         # given a string in CSV format, return a 2d array of fisnar commands
 
-        # get the csv cells into a 2D array (again, no error checking)
-        commands = [line.split(",") for line in csv_string.split("\n")]
-
-        # converting all 2D array entries into proper types
-        i = 0
-        while i < len(commands):
-            if commands[i][0] == "Output":
-                for j in range(1, 3):
-                    commands[i][j] = int(commands[i][j])
-            elif commands[i][0] == "Dummy Point":
-                for j in range(1, 4):
-                    commands[i][j] = float(commands[i][j])
-            elif commands[i][0] == "Line Speed":
-                commands[i][1] = float(commands[i][1])
-            elif commands[i][0] == "Z Clearance":
-                commands[i][1] = int(commands[i][1])
-            elif commands[i][0] == "End Program":
-                pass
-            elif commands[i][0] in ("Line Start", "Line End", "Line Passing"):
-                for j in range(1, 4):
-                    commands[i][j] = float(commands[i][j])
-            else:
-                Logger.log("d", "Unexpected command: '" + str(commands[i][0]) + "'")  # for debugging
-                commands.pop(i)
-                i -= 1  # to be immediately cancelled out by the following line - stay at the same index
-            i += 1
-
-        return copy.deepcopy(commands)
+        # get the csv cells into a 2D array, converting the entries into proper types (again, no error checking)
+        commands = []
+        for line in csv_string.split("\n"):
+            command = line.split(",")
+            value_type = Converter.CSV_VALUE_TYPES.get(command[0])
+            if value_type is None:
+                Logger.log("d", "Unexpected command: '" + str(command[0]) + "'")  # for debugging
+                continue
+            command[0] = Converter.COMMAND_NAMES[command[0]]  # the module's own string, so later name compares can short circuit on identity
+            cast, stop = value_type
+            if stop > 1:
+                command[1:stop] = [cast(value) for value in command[1:stop]]
+            commands.append(command)
+
+        return commands
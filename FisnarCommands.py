@@ -40,7 +40,12 @@ class FisnarCommands():
 
     @staticmethod
     def VA(x, y, z):
-        return bytes("VA " + str(round(float(x), 3)) + ", " + str(round(float(y), 3)) + ", " + str(round(float(z), 3)) + "\r", "ascii")
+        return FisnarCommands.VAList(((x, y, z),))[0]
+
+    @staticmethod
+    def VAList(coords):
+        # get a list of VA command bytes, one for each (x, y, z) in the given iterable. Same as calling VA() for each one
+        return [bytes("VA " + str(round(float(x), 3)) + ", " + str(round(float(y), 3)) + ", " + str(round(float(z), 3)) + "\r", "ascii") for x, y, z in coords]
 
     @staticmethod
     def VX(x):
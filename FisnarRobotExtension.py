@@ -1,27 +1,17 @@
-import copy
 import json
 import numpy
 import os
 import os.path
 import stat
-import sys
-import threading
-import time
 import zipfile
-from typing import Optional, Union, List
-from cura.BuildVolume import BuildVolume
 from cura.CuraApplication import CuraApplication
-from PyQt6.QtCore import QObject, QUrl, QTimer, pyqtSlot, pyqtProperty, pyqtSignal
-from PyQt6.QtQml import QQmlComponent, QQmlContext
+from PyQt6.QtCore import QObject, QTimer, pyqtSlot, pyqtProperty, pyqtSignal
 from UM.Application import Application
 from UM.Extension import Extension
 from UM.Logger import Logger
 from UM.Math.Polygon import Polygon
 from UM.Message import Message
-from UM.PluginRegistry import PluginRegistry
 from UM.Resources import Resources
-from UM.Scene.Iterator.BreadthFirstIterator import BreadthFirstIterator
-from .Converter import Converter
 from .DispenserManager import DispenserManager
 from .PrinterAttributes import PrintSurface
 from .UltimusV import UltimusV
@@ -31,6 +21,13 @@ catalog = i18nCatalog("cura")
 
 class FisnarRobotExtension(QObject, Extension):
 
+    # the two build plate corners (in build volume coords) each of the four disallowed area polygons starts with
+    DISALLOWED_AREA_CORNERS = numpy.array([[[-100, -100], [-100, 100]],
+                                           [[-100, 100], [100, 100]],
+                                           [[100, 100], [100, -100]],
+                                           [[100, -100], [-100, -100]]], dtype=numpy.float32)
+    DISALLOWED_AREA_CORNERS.flags.writeable = False
+
     def __init__(self, parent=None):
         # calling necessary super methods.
         QObject.__init__(self, parent)
@@ -69,6 +66,8 @@ class FisnarRobotExtension(QObject, Extension):
 
         # internal printing preference values
         self.print_surface = PrintSurface(0.0, 200.0, 0.0, 200.0, 150.0)
+        self.print_surface_strings = None  # print surface bounds as strings for qml (see getPrintSurfaceStrings())
+        self.print_surface_strings_bounds = None  # the print surface bounds tuple the strings were made from
         self.com_port = None
 
         # internal pick and place preference values
@@ -94,14 +93,26 @@ class FisnarRobotExtension(QObject, Extension):
         # 'lazy loading' windows, so can be called later.
         self.define_setup_window = None
 
+        # disallowed areas last set on the build volume, and the print surface bounds they were made from
+        self.handled_disallowed_areas = None
+        self.handled_print_surface_bounds = None
+
         # timer for resetting disallowed areas when a file is loaded
         self.reset_dis_areas_timer = QTimer()
         self.reset_dis_areas_timer.setInterval(1000)  # every one second, update disallowed areas. kind of hacky, but works for now
         self.reset_dis_areas_timer.timeout.connect(self.resetDisallowedAreas)
         self.reset_dis_areas_timer.start()
 
+        # single shot timer for resetting disallowed areas after the print surface is edited, so a burst
+        # of edits (ie. tabbing through the coordinate fields) only resets them once
+        self.coord_edit_timer = QTimer()
+        self.coord_edit_timer.setSingleShot(True)
+        self.coord_edit_timer.setInterval(50)
+        self.coord_edit_timer.timeout.connect(self.resetDisallowedAreas)
+
         # filepaths to local resources
         self.this_plugin_path = os.path.join(Resources.getStoragePath(Resources.Resources, "plugins", "FisnarRobotPlugin", "FisnarRobotPlugin"))
+        self.qml_path = os.path.join(self.this_plugin_path, "resources", "qml")
         self.local_meshes_path = os.path.join(Resources.getStoragePathForType(Resources.Resources), "meshes")
         self.local_printer_defs_path = os.path.join(Resources.getStoragePathForType(Resources.DefinitionContainers))
 
@@ -263,6 +274,13 @@ class FisnarRobotExtension(QObject, Extension):
         if node is None:  # can happen if the _cura_app._volume is None
             return
 
+        # nothing to do if the build volume still has the disallowed areas and height last set from the same
+        # print surface. Cura resets these itself sometimes (ie. on machine changes), so this has to be checked
+        print_surface_bounds = self.print_surface.getBounds()
+        if (print_surface_bounds == self.handled_print_surface_bounds and node.getDisallowedAreas() is self.handled_disallowed_areas
+                and node.getHeight() == print_surface_bounds[4]):
+            return
+
         # getting build volume dimensions and original disallowed areas, for documentation
         orig_disallowed_areas = node.getDisallowedAreas()
         x_dim = node.getWidth()  # NOTE: I think width corresponds to x, not sure
@@ -275,26 +293,33 @@ class FisnarRobotExtension(QObject, Extension):
         bv_y_max = self.print_surface.getYMax() - 100
         new_z_dim = self.print_surface.getZMax()
 
-        # establishing new dissalowed areas (list of Polygon objects)
-        new_disallowed_areas = []
-        new_disallowed_areas.append(self.HandledPolygon([[-100, -100], [-100, 100], [bv_x_min, bv_y_max], [bv_x_min, bv_y_min]]))
-        new_disallowed_areas.append(self.HandledPolygon([[-100, 100], [100, 100], [bv_x_max, bv_y_max], [bv_x_min, bv_y_max]]))
-        new_disallowed_areas.append(self.HandledPolygon([[100, 100], [100, -100], [bv_x_max, bv_y_min], [bv_x_max, bv_y_max]]))
-        new_disallowed_areas.append(self.HandledPolygon([[100, -100], [-100, -100], [bv_x_min, bv_y_min], [bv_x_max, bv_y_min]]))
-
-        # removing zero area polygons from disallowed area polygon list
-        i = 0
-        while i < len(new_disallowed_areas):
-            if new_disallowed_areas[i].isZeroArea():
-                # Logger.log("i", f"zero area polygon found in disallowed areas: {new_disallowed_areas[i]}")
-                new_disallowed_areas.pop(i)
-            else:
-                i += 1
-
-        # setting new disallowed areas and rebuilding (not sure if the rebuild is necessary)
-        node.setDisallowedAreas(new_disallowed_areas)
-        node.setHeight(new_z_dim)
+        # the disallowed areas only need to be remade if the x/y bounds changed, or if cura replaced them
+        if (self.handled_print_surface_bounds is None or print_surface_bounds[:4] != self.handled_print_surface_bounds[:4]
+                or node.getDisallowedAreas() is not self.handled_disallowed_areas):
+            # establishing new dissalowed areas (list of Polygon objects). The points of all four polygons are
+            # made as one read-only array - Polygon keeps read-only arrays as they are, rather than converting
+            # or copying them, so each polygon just gets a view of its own points
+            polygon_points = numpy.empty((4, 4, 2), dtype=numpy.float32)
+            polygon_points[:, :2] = FisnarRobotExtension.DISALLOWED_AREA_CORNERS
+            polygon_points[:, 2:] = [[[bv_x_min, bv_y_max], [bv_x_min, bv_y_min]],
+                                     [[bv_x_max, bv_y_max], [bv_x_min, bv_y_max]],
+                                     [[bv_x_max, bv_y_min], [bv_x_max, bv_y_max]],
+                                     [[bv_x_min, bv_y_min], [bv_x_max, bv_y_min]]]
+            polygon_points.flags.writeable = False
+            new_disallowed_areas = [self.HandledPolygon(points) for points in polygon_points]
+
+            # removing zero area polygons from disallowed area polygon list
+            new_disallowed_areas = [polygon for polygon in new_disallowed_areas if not polygon.isZeroArea()]
+
+            node.setDisallowedAreas(new_disallowed_areas)
+            self.handled_disallowed_areas = new_disallowed_areas
+
+        if node.getHeight() != new_z_dim:
+            node.setHeight(new_z_dim)
+
+        # rebuilding, since the disallowed areas and/or height changed to get here (not sure if the rebuild is necessary)
         node.rebuild()
+        self.handled_print_surface_bounds = print_surface_bounds
 
     @pyqtSlot(str, result=str)
     def getTooltip(self, key):
@@ -309,6 +334,15 @@ class FisnarRobotExtension(QObject, Extension):
 
     printSurfaceChanged = pyqtSignal() # signal to notify print surface properties
 
+    def getPrintSurfaceStrings(self):
+        # get the print surface bounds as a (x min, x max, y min, y max, z max) tuple of strings. The strings
+        # are only made again once the print surface changes (PrintSurface.getBounds() returns a new tuple)
+        bounds = self.print_surface.getBounds()
+        if bounds is not self.print_surface_strings_bounds:
+            self.print_surface_strings = tuple(str(coord) for coord in bounds)
+            self.print_surface_strings_bounds = bounds
+        return self.print_surface_strings
+
 # ==================== x min property setup =================
     def setXMin(self, x_min):
         # x min setter
@@ -316,7 +350,7 @@ class FisnarRobotExtension(QObject, Extension):
 
     def getXMin(self):
         # x min getter
-        return str(self.print_surface.getXMin())
+        return self.getPrintSurfaceStrings()[0]
 
     x_min = pyqtProperty(str, fset=setXMin, fget=getXMin, notify=printSurfaceChanged)
 
@@ -327,7 +361,7 @@ class FisnarRobotExtension(QObject, Extension):
 
     def getXMax(self):
         # x max getter
-        return str(self.print_surface.getXMax())
+        return self.getPrintSurfaceStrings()[1]
 
     x_max = pyqtProperty(str, fset=setXMax, fget=getXMax, notify=printSurfaceChanged)
 
@@ -338,7 +372,7 @@ class FisnarRobotExtension(QObject, Extension):
 
     def getYMin(self):
         # y min getter
-        return str(self.print_surface.getYMin())
+        return self.getPrintSurfaceStrings()[2]
 
     y_min = pyqtProperty(str, fset=setYMin, fget=getYMin, notify=printSurfaceChanged)
 
@@ -349,7 +383,7 @@ class FisnarRobotExtension(QObject, Extension):
 
     def getYMax(self):
         # y max getter
-        return str(self.print_surface.getYMax())
+        return self.getPrintSurfaceStrings()[3]
 
     y_max = pyqtProperty(str, fset=setYMax, fget=getYMax, notify=printSurfaceChanged)
 
@@ -360,28 +394,34 @@ class FisnarRobotExtension(QObject, Extension):
 
     def getZMax(self):
         # z max getter
-        return(str(self.print_surface.getZMax()))
+        return self.getPrintSurfaceStrings()[4]
 
     z_max = pyqtProperty(str, fset=setZMax, fget=getZMax, notify=printSurfaceChanged)
 # =========================================================================
 
+    # print surface (setter, getter) for each attribute name qml passes to setCoord()
+    COORD_ACCESSORS = {
+        "fisnar_x_min": (PrintSurface.setXMin, PrintSurface.getXMin),
+        "fisnar_x_max": (PrintSurface.setXMax, PrintSurface.getXMax),
+        "fisnar_y_min": (PrintSurface.setYMin, PrintSurface.getYMin),
+        "fisnar_y_max": (PrintSurface.setYMax, PrintSurface.getYMax),
+        "fisnar_z_max": (PrintSurface.setZMax, PrintSurface.getZMax)
+    }
+
     @pyqtSlot(str, str)
     def setCoord(self, attribute, coord_val):
         # slot for qml to set the value of one of the home coordinates
 
         # updating coordinate value
-        if attribute == "fisnar_x_min":
-            self.setXMin(float(coord_val))
-        elif attribute == "fisnar_x_max":
-            self.setXMax(float(coord_val))
-        elif attribute == "fisnar_y_min":
-            self.setYMin(float(coord_val))
-        elif attribute == "fisnar_y_max":
-            self.setYMax(float(coord_val))
-        elif attribute == "fisnar_z_max":
-            self.setZMax(float(coord_val))
-        else:
+        accessors = FisnarRobotExtension.COORD_ACCESSORS.get(attribute)
+        if accessors is None:
             Logger.log("w", "setCoord() attribute not recognized: '" + str(attribute) + "'")
+            return
+        setter, getter = accessors
+        coord_val = float(coord_val)
+        if getter(self.print_surface) == coord_val:  # unchanged, so nothing needs updating
+            return
+        setter(self.print_surface, coord_val)
 
         # adjusting x min/max values if they are in reverse order
         if self.print_surface.getXMax() < self.print_surface.getXMin():
@@ -398,7 +438,7 @@ class FisnarRobotExtension(QObject, Extension):
             self.printSurfaceChanged.emit()
 
         self.updatePreferencedValues()
-        self.resetDisallowedAreas()  # updating disallowed areas on the build plate
+        self.coord_edit_timer.start()  # updating disallowed areas on the build plate (restarts the timer if already running)
 
 # ==================== COM port name setter/getter system ===================
     comPortNameUpdated = pyqtSignal()  # signal emitted when com port name is updated
@@ -495,33 +535,22 @@ class FisnarRobotExtension(QObject, Extension):
 
     def _createDialogue(self, qml_file_name):
         # Logger.log("i", "***** Fisnar CSV Writer dialogue created")  # test
-        qml_file_path = os.path.join(self.this_plugin_path, "resources", "qml", qml_file_name)
+        qml_file_path = os.path.join(self.qml_path, qml_file_name)
         component = self._application.createQmlComponent(qml_file_path, {"main": self})
         return component
 
     class HandledPolygon(Polygon):
         # class that extends Polygon object so a polygon can be checked if it has been set in this extension or by something else
         # to see if a 'Polygon' object is HandledPolygon, just check the instance's type
-        def __init__(self, points: Optional[Union[numpy.ndarray, List]] = None):
-            super().__init__(points)
 
         def isZeroArea(self):
-            # determine whether a given polygon has zero area
+            # determine whether a given polygon has zero area (all x's or all y's are the same)
             if len(self._points) != 4:
                 return False
 
-            # check if all x's are the same
-            linearly_coincident_x_coords = True
-            for i in range(1, len(self._points)):
-                if numpy.absolute(self._points[0][0] - self._points[i][0]) > 0.001:
-                    linearly_coincident_x_coords = False  # unequal x's, area can't be zero area
-
-            # check if all y's are the same
-            linearly_coincident_y_coords = True
-            for i in range(1, len(self._points)):
-                if numpy.absolute(self._points[0][1] - self._points[i][1]) > 0.0001:
-                    linearly_coincident_y_coords = False  # unequal y's, so area isn't 0 area
-
+            x_coords, y_coords = self._points[:, 0], self._points[:, 1]
+            linearly_coincident_x_coords = bool(numpy.all(numpy.absolute(x_coords[1:] - x_coords[0]) <= 0.001))
+            linearly_coincident_y_coords = bool(numpy.all(numpy.absolute(y_coords[1:] - y_coords[0]) <= 0.0001))
             return (linearly_coincident_x_coords or linearly_coincident_y_coords)
 
     _instance = None
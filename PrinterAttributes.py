@@ -13,6 +13,7 @@ class PrintSurface:
         self.y_min = y_min
         self.y_max = y_max
         self.z_max = z_max
+        self._bounds = None  # cached getBounds() tuple. Reset to None whenever a coord changes
 
     def updateFromTuple(self, coords):
         self.x_min = coords[0]
@@ -20,25 +21,38 @@ class PrintSurface:
         self.y_min = coords[2]
         self.y_max = coords[3]
         self.z_max = coords[4]
+        self._bounds = None
 
     def setXMin(self, x_min):
         self.x_min = float(x_min)
+        self._bounds = None
 
     def setXMax(self, x_max):
         self.x_max = float(x_max)
+        self._bounds = None
 
     def setYMin(self, y_min):
         self.y_min = float(y_min)
+        self._bounds = None
 
     def setYMax(self, y_max):
         self.y_max = float(y_max)
+        self._bounds = None
 
     def setZMax(self, z_max):
         self.z_max = float(z_max)
+        self._bounds = None
 
     def getAsTuple(self):
         return [self.x_min, self.x_max, self.y_min, self.y_max, self.z_max]
 
+    def getBounds(self):
+        # get the coords as a (x min, x max, y min, y max, z max) tuple of floats. The tuple
+        # is built once and reused until a coord changes
+        if self._bounds is None:
+            self._bounds = (float(self.x_min), float(self.x_max), float(self.y_min), float(self.y_max), float(self.z_max))
+        return self._bounds
+
     def getXMin(self):
         return float(self.x_min)
 
@@ -60,6 +74,7 @@ class PrintSurface:
             self.x_min, self.x_max = self.x_max, self.x_min
         if self.y_min > self.y_max:
             self.y_min, self.y_max = self.y_max, self.y_min
+        self._bounds = None
 
     def getDebugString(self):
         return "\nx_min: " + str(self.x_min) + ", " + str(type(self.x_min)) + "\nx_max: " + str(self.x_max) + ", " + str(type(self.x_max)) + "\ny_min: " + str(self.y_min) + ", " + str(type(self.y_min)) + "\ny_max: " + str(self.y_max) + ", " + str(type(self.y_max)) + "\nz_max: " + str(self.z_max) + ", " + str(type(self.z_max))
@@ -13,6 +13,8 @@ class Command:
     :type init_string: str
     """
 
+    NO_PARAMETER_COMMANDS = ("M84",)  # commands that don't require a value after the parameters
+
     def __init__(self, init_string):
         """
         initialization method
@@ -20,8 +22,6 @@ class Command:
 
         err_msg = "Error in marlin.gcode_command.__init__(): "
 
-        no_parameter_commands = ["M84"]  # list of commands that don't require a value after the parameters
-
         if len(init_string) == 0:
             raise ValueError("initialization string can't be empty")
 
@@ -49,7 +49,7 @@ class Command:
         self.params = dict()  # a dictionary storing param - values pairs (ie. {"x": 0, ... }
         for parameter_str in command_list:
             if parameter_str[0].isalpha():
-                if self.command in no_parameter_commands:
+                if self.command in Command.NO_PARAMETER_COMMANDS:
                     self.params[parameter_str.upper()] = 0
                 else:
                     try:
@@ -61,6 +61,24 @@ class Command:
             else:
                 raise ValueError("Unrecognized Marlin parameter passed in argument 'init_string'")
 
+    @classmethod
+    def from_params(cls, command, params):
+        """
+        creates Command object from an already parsed command and parameters,
+        skipping the string parsing and validation done in __init__()
+
+        :param command: g-code command (ie. "G1")
+        :type command: str
+        :param params: parameter - value pairs (ie. {"X": 0.0, ... })
+        :type params: dict
+        :return: Command object
+        :rtype: Command
+        """
+        ret_command = cls.__new__(cls)
+        ret_command.command = command
+        ret_command.params = params
+        return ret_command
+
     def get_command(self):
         """
         :return: g-code command